@@ -1,69 +1,70 @@
 import pandas as pd
 import geopandas as gpd
+import matplotlib
+matplotlib.use('Agg')  # Batch rendering: maps are only written to file
 import matplotlib.pyplot as plt
-from pygris import tracts
+from matplotlib.patches import Patch
 
-def get_tracts(state: str) -> gpd.GeoDataFrame:
-    """
-    Download census tracts for a given state using pygris.
-    
-    Args:
-        state: Two-digit FIPS code for the state (e.g. '48' for Texas)
-        
-    Returns:
-        GeoDataFrame containing census tract geometries and metadata
-    """
-    print(f"Downloading census tracts for state {state}...")
-    tracts_gdf = tracts(state=state, year=2020)
-    
-    # Ensure GEOID is properly formatted as string
-    tracts_gdf['GEOID'] = tracts_gdf['GEOID'].astype(str)
-    
-    return tracts_gdf
+from tract_utils import (CACHE_DIR, SIMPLIFY_TOLERANCE, cache_is_fresh, category_colors,
+                         get_tracts, merged_cache_path, read_geoparquet, render_datashader,
+                         tracts_cache_path, validate_backend)
+
+# Color scheme and legend for opportunity rankings
+_COLOR_SCHEME = {
+    1: '#2ecc71',  # High opportunity - Green
+    2: '#f1c40f',  # Medium opportunity - Yellow 
+    3: '#e74c3c'   # Low opportunity - Red
+}
+_LEGEND_LABELS = {
+    1: 'High Opportunity Area',
+    2: 'Medium Opportunity Area', 
+    3: 'Low Opportunity Area'
+}
+_LEGEND_ELEMENTS = [Patch(facecolor=_COLOR_SCHEME[key], label=_LEGEND_LABELS[key])
+                    for key in _LEGEND_LABELS]
 
 
-def create_opportunity_map(df: gpd.GeoDataFrame, city_name: str, output_path:str) -> None:
+def create_opportunity_map(df: gpd.GeoDataFrame, city_name: str, output_path:str,
+                           backend: str = 'matplotlib', dpi: int = 150) -> None:
     """
     Create and save a choropleth map showing opportunity rankings by census tract.
     
     Args:
         df: GeoDataFrame containing tract geometries and opportunity rankings
         city_name: Name of city for map title
+        output_path: Path where output map should be saved; a .svg path
+            writes vector output (matplotlib backend only)
+        backend: 'matplotlib' for an annotated map, or 'datashader' to
+            rasterize the tracts (faster for very large tract sets)
+        dpi: Resolution of raster output (ignored for .svg and datashader)
     """
-    # Define color scheme for opportunity rankings
-    color_scheme = {
-        1: '#2ecc71',  # High opportunity - Green
-        2: '#f1c40f',  # Medium opportunity - Yellow 
-        3: '#e74c3c'   # Low opportunity - Red
-    }
+    validate_backend(backend, output_path)
+
+    # Reproject once to UTM, then simplify tract outlines to cut the vertex
+    # count matplotlib has to draw. Tracts are not dissolved here so their
+    # boundaries stay visible.
+    plot_df = df.to_crs(df.estimate_utm_crs())
+    plot_df = plot_df.set_geometry(
+        plot_df.geometry.simplify(SIMPLIFY_TOLERANCE, preserve_topology=True))
+
+    if backend == 'datashader':
+        render_datashader(plot_df, 'COMP_RANK', _COLOR_SCHEME, output_path)
+        return
     
     fig, ax = plt.subplots(figsize=(15, 10))
     
     # Create the main plot
-    df.plot(
+    plot_df.plot(
         column='COMP_RANK',
         categorical=True,
         legend=False,
-        color=[color_scheme.get(rank, '#FFFFFF') for rank in df['COMP_RANK']],
+        color=category_colors(plot_df['COMP_RANK'].astype('category'), _COLOR_SCHEME),
         edgecolor='0.8',
         linewidth=0.8,
         ax=ax
     )
 
-    # Create custom legend with descriptive labels
-    legend_labels = {
-        1: 'High Opportunity Area',
-        2: 'Medium Opportunity Area', 
-        3: 'Low Opportunity Area'
-    }
-
-    # Add legend patches
-    from matplotlib.patches import Patch
-    legend_elements = [Patch(facecolor=color_scheme[key],
-                           label=legend_labels[key])
-                      for key in sorted(color_scheme.keys())]
-    
-    ax.legend(handles=legend_elements,
+    ax.legend(handles=_LEGEND_ELEMENTS,
              title='Opportunity Rankings',
              bbox_to_anchor=(1.1, 0.95),
              loc='upper left')
@@ -71,57 +72,98 @@ def create_opportunity_map(df: gpd.GeoDataFrame, city_name: str, output_path:str
     plt.title(f'Opportunity Rankings by Census Tract - {city_name} (2020)')
     plt.axis('off')
     plt.tight_layout()
-    plt.show()
     # Save outputs
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close()
 
+
+def read_roi(roi_path: str) -> pd.DataFrame:
+    """
+    Read ROI (Regions of Interest) data from CSV.
+    
+    Args:
+        roi_path: Path to ROI data CSV file
+        
+    Returns:
+        DataFrame containing ROI data, with FIPS codes as strings
+    """
+    return pd.read_csv(roi_path, dtype={'FIPS': 'string[pyarrow]'})
+
+
 def merge_geo_roi(roi: pd.DataFrame, geo: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
     Merge ROI (Regions of Interest) data with geographic tract data.
     
     Args:
-        roi: DataFrame containing ROI data with FIPS codes
-        geo: GeoDataFrame containing census tract geometries
+        roi: DataFrame containing ROI data with string FIPS codes (see read_roi)
+        geo: GeoDataFrame containing census tract geometries (see get_tracts)
         
     Returns:
         GeoDataFrame with merged ROI and geographic data
     """
-    roi['FIPS'] = roi['FIPS'].astype(str)
-    geo['GEOID'] = geo['GEOID'].astype(str)
-    return geo.merge(roi, left_on='GEOID', right_on='FIPS', how='left')
+    # read_roi and get_tracts (including cached reads) both give string[pyarrow]
+    # keys; align on them as indexes. The GEOID/FIPS columns are kept, so the
+    # join index is dropped afterwards.
+    roi = roi.set_index(roi['FIPS'])
+    geo = geo.set_index(geo['GEOID'])
+    return geo.join(roi, how='left').reset_index(drop=True)
 
 
-def process_opportunity_data(state: str, county_fips: str, roi_path: str, city_name: str) -> None:
+def load_opportunity_data(state: str, county_fips: str, roi_path: str) -> gpd.GeoDataFrame:
     """
-    Process and visualize opportunity data for a given city/county.
+    Load county tract geometries merged with ROI data.
+
+    The merged frame is cached as GeoParquet under CACHE_DIR, keyed by the
+    county and the ROI file, and reused until the ROI file or the county's
+    tract cache is modified.
     
     Args:
         state: Two-digit FIPS code for the state
         county_fips: Three-digit FIPS code for the county
         roi_path: Path to ROI data CSV file
-        city_name: Name of the city for visualization
+        
+    Returns:
+        GeoDataFrame with merged ROI and geographic data
     """
-    # Get tract geometries
-    tracts_gdf = get_tracts(state)
-    
-    # Filter to specific county
-    county_tracts = tracts_gdf[tracts_gdf['COUNTYFP'] == county_fips]
+    cache_path = merged_cache_path('opportunity', state, county_fips, roi_path)
+    if cache_is_fresh(cache_path, roi_path, tracts_cache_path(state, county_fips)):
+        print(f"Loading cached opportunity data for {state}_{county_fips}...")
+        return read_geoparquet(cache_path)
+
+    # Get tract geometries for the county
+    county_tracts = get_tracts(state, county_fips)
     
     # Read and merge ROI data
-    roi_data = pd.read_csv(roi_path)
+    roi_data = read_roi(roi_path)
     merged_data = merge_geo_roi(roi_data, county_tracts)
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    merged_data.to_parquet(cache_path)
+    
+    return merged_data
+
+
+def process_opportunity_data(state: str, county_fips: str, roi_path: str, city_name: str,
+                             output_path: str) -> None:
+    """
+    Process and visualize opportunity data for a given city/county.
+    
+    Args:
+        state: Two-digit FIPS code for the state
+        county_fips: Three-digit FIPS code for the county
+        roi_path: Path to ROI data CSV file
+        city_name: Name of the city for visualization
+        output_path: Path where output map should be saved
+    """
+    merged_data = load_opportunity_data(state, county_fips, roi_path)
     
     # Create visualization
-    create_opportunity_map(merged_data, city_name)
+    create_opportunity_map(merged_data, city_name, output_path)
 
 
 # Example usage
-mi_tracts = get_tracts('26')  # Michigan
-wayne_tracts = mi_tracts[mi_tracts['COUNTYFP']=='163']  # Wayne County
-roi_detroit = pd.read_csv('data/roi/detroit_roi.csv')
-merged_detroit = merge_geo_roi(roi_detroit, wayne_tracts)
-create_opportunity_map(merged_detroit, 'Detroit', 'output/detroit_opportunity.png')
+process_opportunity_data('26', '163', 'data/roi/detroit_roi.csv', 'Detroit',
+                         'output/detroit_opportunity.png')  # Wayne County, MI
 
 # Uncomment for Austin analysis
-#process_opportunity_data('48', '453', 'roi_austin/austin_roi.csv', 'Austin')
\ No newline at end of file
+#process_opportunity_data('48', '453', 'roi_austin/austin_roi.csv', 'Austin', 'output/austin_opportunity.png')
\ No newline at end of file
@@ -9,61 +9,121 @@ This module provides functionality to:
 The main workflow involves:
 - Downloading tract geometries for a given state
 - Reading and processing demographic data from PL files
-- Merging demographic data with tract geometries
+- Merging demographic data with tract geometries (cached as GeoParquet)
 - Creating visualizations of racial/ethnic distributions
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 import matplotlib.pyplot as plt
-from pygris import tracts
+from matplotlib.patches import Patch
+
+from tract_utils import (CACHE_DIR, SIMPLIFY_TOLERANCE, cache_is_fresh, category_colors,
+                         get_tracts, merged_cache_path, read_geoparquet, render_datashader,
+                         tracts_cache_path, validate_backend)
+
+# Column positions used from the PL geographic header and Part 1 files;
+# Part 1 positions map to the population count names used downstream
+GEO_COLUMNS = [9, 14, 88, 90]
+PART1_COLUMNS = {
+    6: 'total_pop',
+    7: 'white_alone',
+    8: 'black_alone',
+    9: 'aian_alone',
+    10: 'asian_alone',
+    11: 'nhpi_alone',
+    12: 'other_alone',
+    73: 'hispanic'
+}
+
+# Single worker for QA exports, so they run in order off the main thread
+_QA_EXECUTOR = ThreadPoolExecutor(max_workers=1)
 
+# Color scheme and legend for racial/ethnic groups
+_COLOR_SCHEME = {
+    'white_nh': '#FFB6C1',    # Light pink
+    'black_alone': '#87CEEB',  # Sky blue
+    'asian_alone': '#98FB98',  # Pale green
+    'hispanic': '#DDA0DD',     # Plum
+    'aian_alone': '#F0E68C',   # Khaki
+    'nhpi_alone': '#FFA07A',   # Light salmon
+    'other_alone': '#D3D3D3',  # Light gray
+    'Unknown': '#FFFFFF'       # White
+}
+_LEGEND_LABELS = {
+    'white_nh': 'White (Non-Hispanic)',
+    'black_alone': 'Black/African American',
+    'asian_alone': 'Asian',
+    'hispanic': 'Hispanic/Latino',
+    'aian_alone': 'American Indian/Alaska Native',
+    'nhpi_alone': 'Native Hawaiian/Pacific Islander',
+    'other_alone': 'Other Race',
+    'Unknown': 'Unknown'
+}
+_LEGEND_ELEMENTS = [Patch(facecolor=_COLOR_SCHEME[key], label=_LEGEND_LABELS[key])
+                    for key in _LEGEND_LABELS]
 
-def get_tracts(state: str) -> gpd.GeoDataFrame:
+
+def read_pl_file(file_path: str,
+                 usecols: list[int] | None = None,
+                 dtype: str | dict = 'string[pyarrow]') -> pd.DataFrame:
     """
-    Download census tracts for a given state using pygris.
+    Read PL 94-171 redistricting data file.
+
+    PL files have no header row, so columns are labelled by their position.
+    They are plain ASCII, so they are decoded as latin1, which accepts any
+    byte and never needs a second pass.
     
     Args:
-        state: Two-digit FIPS code for the state (e.g. '48' for Texas)
+        file_path: Path to the PL data file
+        usecols: Positions of the columns to read (all columns if None)
+        dtype: Column dtype, or a dict mapping column position to dtype
         
     Returns:
-        GeoDataFrame containing census tract geometries and metadata
+        DataFrame containing the requested PL file columns
     """
-    print(f"Downloading census tracts for state {state}...")
-    tracts_gdf = tracts(state=state, year=2020)
-    
-    # Ensure GEOID is properly formatted as string
-    tracts_gdf['GEOID'] = tracts_gdf['GEOID'].astype(str)
-    
-    return tracts_gdf
+    return pd.read_csv(file_path,
+                       delimiter='|',
+                       header=None,
+                       usecols=usecols,
+                       dtype=dtype,
+                       encoding='latin1',
+                       low_memory=False)
 
 
-def read_pl_file(file_path: str) -> pd.DataFrame:
+def read_pl_geo_file(file_path: str, usecols: list[int]) -> pd.DataFrame:
     """
-    Read PL 94-171 redistricting data file with multiple encoding attempts.
+    Read selected columns of a PL 94-171 geographic header file as strings.
+
+    The geo header file is the largest PL input and only a few of its
+    columns are needed, so it is read with Arrow's multithreaded CSV reader
+    directly, which never materializes the other columns.
     
     Args:
-        file_path: Path to the PL data file
+        file_path: Path to the geographic header file
+        usecols: Positions of the columns to read
         
     Returns:
-        DataFrame containing the PL file data
-        
-    Raises:
-        ValueError: If file cannot be read with any supported encoding
+        DataFrame of string[pyarrow] columns labelled by their position
     """
-    encodings = ['latin1', 'iso-8859-1', 'cp1252']
-    
-    for encoding in encodings:
-        try:
-            return pd.read_csv(file_path,
-                             delimiter='|',
-                             dtype=str, 
-                             encoding=encoding,
-                             low_memory=False)
-        except UnicodeDecodeError:
-            continue
-    
-    raise ValueError(f"Could not read file {file_path} with any supported encoding")
+    names = [f'f{col}' for col in usecols]
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(autogenerate_column_names=True,
+                                        encoding='latin1'),
+        parse_options=pa_csv.ParseOptions(delimiter='|'),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=names,
+            column_types={name: pa.string() for name in names}))
+
+    geo_df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+    geo_df.columns = usecols
+    return geo_df
 
 
 def read_pl_data(geo_file_path: str, part1_file_path: str) -> pd.DataFrame:
@@ -75,112 +135,175 @@ def read_pl_data(geo_file_path: str, part1_file_path: str) -> pd.DataFrame:
         part1_file_path: Path to Part 1 demographic file
         
     Returns:
-        DataFrame containing processed demographic data by tract
+        DataFrame containing processed demographic data, indexed by GEOID
+        in sorted order
     """
-    # Read input files
+    # Read only the columns used below
     print("Reading geographic header file...")
-    geo_df = read_pl_file(geo_file_path)
+    geo_df = read_pl_geo_file(geo_file_path, GEO_COLUMNS)
     print("Reading Part 1 demographic file...")
-    part1_df = read_pl_file(part1_file_path)
+    part1_df = read_pl_file(part1_file_path,
+                            usecols=list(PART1_COLUMNS),
+                            dtype={col: 'float32' for col in PART1_COLUMNS})
     
     print("Processing demographic data...")
     
-    # Create demographics DataFrame with population counts
-    demographics = pd.DataFrame({
-        'total_pop': pd.to_numeric(part1_df.iloc[:, 6], errors='coerce'),
-        'white_alone': pd.to_numeric(part1_df.iloc[:, 7], errors='coerce'),
-        'black_alone': pd.to_numeric(part1_df.iloc[:, 8], errors='coerce'),
-        'aian_alone': pd.to_numeric(part1_df.iloc[:, 9], errors='coerce'),
-        'asian_alone': pd.to_numeric(part1_df.iloc[:, 10], errors='coerce'),
-        'nhpi_alone': pd.to_numeric(part1_df.iloc[:, 11], errors='coerce'),
-        'other_alone': pd.to_numeric(part1_df.iloc[:, 12], errors='coerce'),
-        'hispanic': pd.to_numeric(part1_df.iloc[:, 73], errors='coerce')
-    })
+    # Population counts arrive as float32 from the typed read; just name them
+    demographics = part1_df.rename(columns=PART1_COLUMNS)
     
     # Add geographic identifiers
-    demographics['GEOID'] = geo_df.iloc[:, 9]  # Tract identifier
-    demographics['County'] = geo_df.iloc[:, 14].astype(str).str.strip()
-    demographics['BeforeCounty'] = geo_df.iloc[:, 88]
-    demographics['AfterCounty'] = geo_df.iloc[:, 90]
+    demographics['GEOID'] = geo_df[9]  # Tract identifier
+    demographics['County'] = geo_df[14].str.strip()
+    demographics['BeforeCounty'] = geo_df[88]
+    demographics['AfterCounty'] = geo_df[90]
     
     # Calculate derived demographic fields
-    demographics['white_nh'] = demographics['white_alone'] - demographics['hispanic']
+    # Subtract the float32 count buffers directly so the result stays float32
+    demographics['white_nh'] = np.subtract(demographics['white_alone'].to_numpy(),
+                                           demographics['hispanic'].to_numpy(),
+                                           dtype=np.float32)
     
     # Determine dominant racial/ethnic group
     race_cols = ['white_nh', 'black_alone', 'aian_alone', 'asian_alone',
                  'nhpi_alone', 'other_alone', 'hispanic']
-    demographics['dominant_race'] = demographics[race_cols].idxmax(axis=1)
+    counts = np.column_stack([demographics[col].to_numpy(dtype=np.float32, na_value=np.nan)
+                              for col in race_cols])
+    no_data = np.isnan(counts).all(axis=1)
+    # nanargmax raises on all-NaN rows; give those a dummy index and blank them below
+    counts[no_data] = 0
+    dominant = np.asarray(race_cols, dtype=object)[np.nanargmax(counts, axis=1)]
+    dominant[no_data] = None
+    demographics['dominant_race'] = dominant
     
-    return demographics
+    # A sorted GEOID index lets the tract join align monotonic indexes
+    return demographics.sort_values('GEOID').set_index('GEOID')
 
 
-def create_racial_map(gdf: gpd.GeoDataFrame,
-                     demographics: pd.DataFrame,
-                     output_path: str,
-                     county_name: str) -> gpd.GeoDataFrame:
+def merge_demographics(gdf: gpd.GeoDataFrame, demographics: pd.DataFrame) -> gpd.GeoDataFrame:
     """
-    Create and save a choropleth map showing dominant racial/ethnic group by tract.
+    Merge demographic data onto tract geometries.
     
     Args:
         gdf: GeoDataFrame containing tract geometries
-        demographics: DataFrame containing demographic data
-        output_path: Path where output map should be saved
-        county_name: Name of county for map title
+        demographics: DataFrame containing demographic data, indexed by
+            GEOID (see read_pl_data)
+        
+    Returns:
+        GeoDataFrame containing merged geometry and demographic data, with
+        tracts lacking demographic data marked 'Unknown'
+    """
+    # Merge geometric and demographic data, aligned on GEOID indexes
+    merged_gdf = (gdf.set_index('GEOID')
+                  .join(demographics, how='left')
+                  .reset_index())
+    
+    # Handle missing data
+    merged_gdf['dominant_race'] = merged_gdf['dominant_race'].fillna('Unknown').astype('category')
+    
+    return merged_gdf
+
+
+def load_demographic_tracts(state: str, county: str,
+                            geo_file_path: str, part1_file_path: str) -> gpd.GeoDataFrame:
+    """
+    Load county tract geometries merged with PL 94-171 demographic data.
+
+    The merged frame is cached as GeoParquet under CACHE_DIR, keyed by the
+    county and the PL files, and reused until either PL file or the county's
+    tract cache is modified, skipping the PL ingest entirely.
+    
+    Args:
+        state: Two-digit FIPS code for the state
+        county: Three-digit FIPS code for the county
+        geo_file_path: Path to geographic header file
+        part1_file_path: Path to Part 1 demographic file
         
     Returns:
         GeoDataFrame containing merged geometry and demographic data
     """
+    cache_path = merged_cache_path('demographics', state, county,
+                                   geo_file_path, part1_file_path)
+    if cache_is_fresh(cache_path, geo_file_path, part1_file_path,
+                      tracts_cache_path(state, county)):
+        print(f"Loading cached demographic tracts for {state}_{county}...")
+        return read_geoparquet(cache_path)
+
+    merged_gdf = merge_demographics(get_tracts(state, county),
+                                    read_pl_data(geo_file_path, part1_file_path))
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    merged_gdf.to_parquet(cache_path)
+    
+    return merged_gdf
+
+
+def _report_qa_error(future: Future) -> None:
+    """
+    Report a failed background QA write, which would otherwise be silent.
+    """
+    if future.exception() is not None:
+        print(f"Failed to write unmatched tracts: {future.exception()}")
+
+
+def create_racial_map(merged_gdf: gpd.GeoDataFrame,
+                     output_path: str,
+                     county_name: str,
+                     backend: str = 'matplotlib',
+                     dpi: int = 150) -> None:
+    """
+    Create and save a choropleth map showing dominant racial/ethnic group by tract.
+    
+    Args:
+        merged_gdf: GeoDataFrame containing merged geometry and demographic
+            data (see merge_demographics)
+        output_path: Path where output map should be saved; a .svg path
+            writes vector output (matplotlib backend only)
+        county_name: Name of county for map title
+        backend: 'matplotlib' for an annotated map, or 'datashader' to
+            rasterize the tracts (faster for very large tract sets)
+        dpi: Resolution of raster output (ignored for .svg and datashader)
+    """
+    validate_backend(backend, output_path)
+
     print("Creating demographic map...")
     
-    # Merge geometric and demographic data
-    merged_gdf = gdf.merge(demographics, on='GEOID', how='left')
+    # Merge tracts sharing a dominant group, so matplotlib draws one shape
+    # per group instead of one per tract. Simplify after dissolving: per-tract
+    # simplification misaligns shared edges and leaves slivers in the union.
+    # The dissolved shapes are reprojected to UTM first, so the tolerance is
+    # in meters.
+    plot_gdf = (merged_gdf[['dominant_race', 'geometry']]
+                .dissolve(by='dominant_race', observed=True)
+                .reset_index())
+    plot_gdf = plot_gdf.to_crs(plot_gdf.estimate_utm_crs())
+    plot_gdf = plot_gdf.set_geometry(
+        plot_gdf.geometry.simplify(SIMPLIFY_TOLERANCE, preserve_topology=True))
+
+    # Save unmatched records for QA in the background while the map renders
+    unmatched_mask = merged_gdf['dominant_race'].eq('Unknown')
+    if unmatched_mask.any():
+        unmatched = merged_gdf.loc[unmatched_mask, ['GEOID', 'dominant_race']]
+        future = _QA_EXECUTOR.submit(unmatched.to_csv, 'unmatched_tracts.csv.gz',
+                                     index=False, compression='infer')
+        future.add_done_callback(_report_qa_error)
     
-    # Handle missing data
-    merged_gdf['dominant_race'] = merged_gdf['dominant_race'].fillna('Unknown')
-    
-    # Define color scheme for racial/ethnic groups
-    color_scheme = {
-        'white_nh': '#FFB6C1',    # Light pink
-        'black_alone': '#87CEEB',  # Sky blue
-        'asian_alone': '#98FB98',  # Pale green
-        'hispanic': '#DDA0DD',     # Plum
-        'aian_alone': '#F0E68C',   # Khaki
-        'nhpi_alone': '#FFA07A',   # Light salmon
-        'other_alone': '#D3D3D3',  # Light gray
-        'Unknown': '#FFFFFF'       # White
-    }
+    if backend == 'datashader':
+        render_datashader(plot_gdf, 'dominant_race', _COLOR_SCHEME, output_path)
+        return
 
     # Create visualization
     fig, ax = plt.subplots(figsize=(15, 10))
     
     # Create the main plot
-    merged_gdf.plot(
+    plot_gdf.plot(
         column='dominant_race',
         categorical=True,
         legend=False,  # Disable default legend
-        color=[color_scheme[race] for race in merged_gdf['dominant_race']],
+        color=category_colors(plot_gdf['dominant_race'], _COLOR_SCHEME),
         ax=ax
     )
 
-    # Create custom legend with descriptive labels
-    legend_labels = {
-        'white_nh': 'White (Non-Hispanic)',
-        'black_alone': 'Black/African American',
-        'asian_alone': 'Asian',
-        'hispanic': 'Hispanic/Latino',
-        'aian_alone': 'American Indian/Alaska Native',
-        'nhpi_alone': 'Native Hawaiian/Pacific Islander',
-        'other_alone': 'Other Race',
-        'Unknown': 'Unknown'
-    }
-
-    # Add legend patches
-    from matplotlib.patches import Patch
-    legend_elements = [Patch(facecolor=color_scheme[key], 
-                           label=legend_labels[key]) 
-                      for key in color_scheme.keys()]
-    
-    ax.legend(handles=legend_elements, 
+    ax.legend(handles=_LEGEND_ELEMENTS, 
              title='Dominant Race/Ethnicity',
              bbox_to_anchor=(1.1, 0.95),
              loc='upper left')
@@ -188,28 +311,15 @@ def create_racial_map(gdf: gpd.GeoDataFrame,
     plt.axis('off')
     
     # Save outputs
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close()
-    
-    # Save unmatched records for QA
-    unmatched = merged_gdf[merged_gdf['dominant_race'] == 'Unknown']
-    if len(unmatched) > 0:
-        unmatched[['GEOID', 'dominant_race']].to_csv('unmatched_tracts.csv', index=False)
-    
-    return merged_gdf
-
-
-# Download tract geometries
-tx_tracts = get_tracts('48')  # Texas
-mi_tracts = get_tracts('26')  # Michigan
 
-# Process demographic data
-demo_mi = read_pl_data('mi2020.pl/migeo2020.pl', 'mi2020.pl/mi000012020.pl')
-demo_tx = read_pl_data('tx2020.pl/txgeo2020.pl', 'tx2020.pl/tx000012020.pl')
 
-# Filter to specific counties
-wayne_tracts = mi_tracts[mi_tracts['COUNTYFP']=='163']  # Wayne County, MI
-travis_tracts = tx_tracts[tx_tracts['COUNTYFP']=='453'] # Travis County, TX
+# Load tract geometries merged with demographic data for the counties of interest
+wayne_gdf = load_demographic_tracts('26', '163',     # Wayne County, MI
+                                    'mi2020.pl/migeo2020.pl', 'mi2020.pl/mi000012020.pl')
+travis_gdf = load_demographic_tracts('48', '453',    # Travis County, TX
+                                     'tx2020.pl/txgeo2020.pl', 'tx2020.pl/tx000012020.pl')
 
-create_racial_map(wayne_tracts, demo_mi, 'output/ouwayne_map.png', 'Wayne')
-create_racial_map(travis_tracts, demo_tx, 'output/travis_map.png', 'Travis')
+create_racial_map(wayne_gdf, 'output/ouwayne_map.png', 'Wayne')
+create_racial_map(travis_gdf, 'output/travis_map.png', 'Travis')
@@ -0,0 +1,208 @@
+"""
+Shared helpers for the census tract map scripts.
+
+Provides cached tract downloads, cache paths and freshness checks, and the
+color and datashader rendering helpers used by process_opportunity and
+process_race_demo.
+"""
+
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from pygris import tracts
+
+# Local cache for downloaded tracts and merged map data (GeoParquet)
+CACHE_DIR = Path('cache')
+
+# Simplification tolerance applied to tract geometries before plotting, in
+# meters (maps are drawn in the local UTM zone rather than EPSG:4269)
+SIMPLIFY_TOLERANCE = 50
+
+
+def read_geoparquet(path: Path) -> gpd.GeoDataFrame:
+    """
+    Read a cached GeoParquet file.
+
+    Parquet restores string columns as string[python]. They are recast to
+    the string[pyarrow] dtype used at ingestion, so GEOID joins against
+    freshly loaded frames stay Arrow-backed instead of falling back to an
+    object index.
+    
+    Args:
+        path: Path to the GeoParquet file
+        
+    Returns:
+        GeoDataFrame read from the file
+    """
+    gdf = gpd.read_parquet(path)
+    return gdf.astype({col: 'string[pyarrow]' for col in gdf.select_dtypes('string').columns})
+
+
+def tracts_cache_path(state: str, county: str | None = None) -> Path:
+    """
+    Path of the cached tract download for a state or one of its counties.
+    """
+    suffix = f'{state}_{county}' if county else state
+    return CACHE_DIR / f'tracts_{suffix}_2020.parquet'
+
+
+def merged_cache_path(prefix: str, state: str, county: str, *input_paths: str) -> Path:
+    """
+    Path of a cached merged frame for a county.
+
+    The file name includes a hash of the resolved input paths, so the same
+    county built from different input files gets its own cache file.
+    
+    Args:
+        prefix: Name prefix identifying the kind of merged data
+        state: Two-digit FIPS code for the state
+        county: Three-digit FIPS code for the county
+        input_paths: Paths of the files the merged frame is built from
+        
+    Returns:
+        Path of the cache file under CACHE_DIR
+    """
+    resolved = '\n'.join(str(Path(p).resolve()) for p in input_paths)
+    digest = hashlib.sha1(resolved.encode()).hexdigest()[:12]
+    return CACHE_DIR / f'{prefix}_{state}_{county}_{digest}.parquet'
+
+
+def cache_is_fresh(cache_path: Path, *input_paths: str | Path) -> bool:
+    """
+    Check whether a cached file exists and is newer than all of its inputs.
+    A missing input counts as stale, so the cache is rebuilt from scratch.
+    """
+    if not cache_path.exists():
+        return False
+    cache_mtime = cache_path.stat().st_mtime
+    return all(Path(p).exists() and cache_mtime > Path(p).stat().st_mtime for p in input_paths)
+
+
+@lru_cache(maxsize=None)
+def _load_tracts(state: str, county: str | None) -> gpd.GeoDataFrame:
+    """
+    Load census tracts for a state (or one of its counties) from the local
+    Parquet cache, downloading them with pygris and populating the cache on
+    a miss.
+    """
+    suffix = f'{state}_{county}' if county else state
+    cache_path = tracts_cache_path(state, county)
+    if cache_path.exists():
+        print(f"Loading cached census tracts for {suffix}...")
+        return read_geoparquet(cache_path)
+
+    print(f"Downloading census tracts for {suffix}...")
+    tracts_gdf = tracts(state=state, county=county, year=2020)
+    
+    # Store GEOID as Arrow-backed strings once, at ingestion
+    tracts_gdf['GEOID'] = tracts_gdf['GEOID'].astype('string[pyarrow]')
+    # Sort once before caching so GEOID joins can take the monotonic fast path
+    tracts_gdf = tracts_gdf.sort_values('GEOID', ignore_index=True)
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    tracts_gdf.to_parquet(cache_path)
+    
+    return tracts_gdf
+
+
+def get_tracts(state: str, county: str | None = None) -> gpd.GeoDataFrame:
+    """
+    Download census tracts for a given state, or a single county within it,
+    using pygris.
+
+    Results are cached as Parquet under CACHE_DIR, so only the first run
+    for a state or county hits the network and parses the shapefile.
+    
+    Args:
+        state: Two-digit FIPS code for the state (e.g. '48' for Texas)
+        county: Optional three-digit county FIPS code (e.g. '453' for Travis);
+            when given, only that county's tracts are returned
+        
+    Returns:
+        GeoDataFrame containing census tract geometries and metadata
+    """
+    # Copy so callers cannot mutate the in-memory cached frame
+    return _load_tracts(state, county).copy()
+
+
+def category_colors(values: pd.Series, color_scheme: dict, missing: str = '#FFFFFF') -> np.ndarray:
+    """
+    Map a categorical Series to plot colors with a single gather over its codes.
+    
+    Args:
+        values: Categorical Series to color
+        color_scheme: Mapping from category to color
+        missing: Color for NaN values and categories not in color_scheme
+        
+    Returns:
+        Array with one color per row of values
+    """
+    palette = np.array([color_scheme.get(cat, missing) for cat in values.cat.categories]
+                       + [missing])
+    # NaN has category code -1, which selects the trailing `missing` entry
+    return palette[values.cat.codes.to_numpy()]
+
+
+def validate_backend(backend: str, output_path: str) -> None:
+    """
+    Check a map rendering backend and output path before any work is done.
+    
+    Args:
+        backend: 'matplotlib' or 'datashader'
+        output_path: Path where output map should be saved
+        
+    Raises:
+        ValueError: If the backend is unknown, or datashader is asked for
+            vector output
+    """
+    if backend not in ('matplotlib', 'datashader'):
+        raise ValueError(f"Unknown backend {backend!r}")
+    if backend == 'datashader' and Path(output_path).suffix.lower() == '.svg':
+        raise ValueError("The datashader backend writes raster images; use a .png output path")
+
+
+def render_datashader(gdf: gpd.GeoDataFrame, column: str, color_scheme: dict,
+                      output_path: str, plot_width: int = 1500) -> None:
+    """
+    Rasterize tract polygons with datashader and save the image.
+
+    Requires the optional datashader and spatialpandas packages. The image
+    has no title or legend, and its height follows the data's aspect ratio,
+    so gdf should be in a projected CRS.
+    Tracts with no value in column are left as white background, as in the
+    matplotlib maps.
+    
+    Args:
+        gdf: GeoDataFrame containing tract geometries
+        column: Column whose categories determine the fill color
+        color_scheme: Mapping from category to color
+        output_path: Path where output image should be saved (raster only)
+        plot_width: Width of the output image in pixels
+    """
+    import datashader as ds
+    import datashader.transfer_functions as tf
+    import spatialpandas
+
+    # Frame the full extent, including tracts left blank below
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    plot_height = max(1, round(plot_width * (ymax - ymin) / (xmax - xmin)))
+
+    # ds.by() reads NaN's -1 category code as the last category, so drop
+    # those tracts rather than let them take another group's color
+    gdf = gdf[gdf[column].notna()]
+    values = gdf[column].astype('category')
+    # Pass the Categorical itself: ds.by() needs a categorical column
+    sdf = spatialpandas.GeoDataFrame(
+        gpd.GeoDataFrame({column: values.array},
+                         geometry=gdf.geometry.to_numpy(), crs=gdf.crs))
+
+    canvas = ds.Canvas(plot_width=plot_width, plot_height=plot_height,
+                       x_range=(xmin, xmax), y_range=(ymin, ymax))
+    agg = canvas.polygons(sdf, geometry='geometry', agg=ds.by(column))
+    color_key = {cat: color_scheme.get(cat, '#FFFFFF') for cat in values.cat.categories}
+    img = tf.set_background(tf.shade(agg, color_key=color_key), 'white')
+    img.to_pil().save(output_path)